@@ -1,220 +1,266 @@
 import os
 import sys
+import logging
 from syncing.config import SyncConfig
 from syncing.yline_check import find_yline_after_start_handshake
 from syncing.logging_setup import setup_logging
-from syncing.file_matching import match_led_file, extract_expected_diff_from_filename
+from syncing.file_matching import LedIndex, match_led_file, list_led_index, extract_expected_diff_from_filename, extract_recid
 from syncing.digital_events import DigitalEvents
 from syncing.arduino_led import ArduinoLEDLogs
 from syncing.handshake import HandshakeDetector
-from syncing.anomalies import AnomalyHandler
-from syncing.utils import trim_to_handshake_windows, trim_with_index_mapping
+from syncing.anomalies import AnomalyHandler, TYPE_NAMES
+from syncing.utils import trim_and_map
 from syncing.fix_anomalies import AnomalyFixer
 import numpy as np
 import csv
 import json
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 import traceback
 
+logger = logging.getLogger("syncing")
+
+SUMMARY_FIELDNAMES = [
+    "run_id", "mea_file", "mea_path", "led_file", "status", "error_type", "error_message",
+    "yline_error_found", "yline_error_count", "yline_error_details", "note"
+]
+
+
+def init_worker(log_dir: str, log_level: str, log_file: str):
+    """Attaches the run's log file in worker processes that start without handlers (spawn)."""
+    setup_logging(log_dir, log_level, log_file=log_file, file_mode="a")
+
+
+def process_one(mea_filename: str, cfg: SyncConfig, run_id: str, led_index: LedIndex,
+                detector: HandshakeDetector) -> dict:
+    """Syncs a single MEA file against its LED log and returns its summary row."""
+    mea_path = os.path.join(cfg.path_h5_dir, mea_filename)
+    logger.info("Processing MEA file: %s", mea_filename)
+
+    row = {
+        "run_id": run_id,
+        "mea_file": mea_filename,
+        "mea_path": mea_path,
+        "led_file": None,
+        "status": "started",
+        "error_type": None,
+        "error_message": None,
+        "yline_error_found": False,
+        "yline_error_count": 0,
+        "yline_error_details": None,
+        "note": ""
+    }
+
+    try:
+        # RecID filtering
+        if cfg.rec_id_start or cfg.rec_id_end:
+            recid_num = extract_recid(mea_filename)
+            if recid_num is None:
+                logger.warning("No RecID in filename, skipping: %s", mea_filename)
+                row["status"] = "skipped"
+                row["note"] = "Skipped: no RecID in filename."
+                return row
+            if cfg.rec_id_start and recid_num < cfg.rec_id_start:
+                row["status"] = "skipped"
+                row["note"] = f"Skipped: RecID {recid_num} < rec_id_start {cfg.rec_id_start}."
+                return row
+            if cfg.rec_id_end and recid_num > cfg.rec_id_end:
+                row["status"] = "skipped"
+                row["note"] = f"Skipped: RecID {recid_num} > rec_id_end {cfg.rec_id_end}."
+                return row
+
+        # Match LED file
+        try:
+            led_path = match_led_file(mea_filename, cfg.path_led_dir, led_index=led_index)
+        except Exception as e:
+            logger.error("Could not match LED file for %s: %s", mea_filename, e)
+            row["status"] = "failed"
+            row["error_type"] = type(e).__name__
+            row["error_message"] = str(e)
+            row["note"] = "Failed during LED log matching."
+            return row
+
+        if not led_path:
+            row["status"] = "failed"
+            row["error_type"] = "LedLogNotFoundError"
+            row["error_message"] = "match_led_file returned None (likely no RecID found in MEA filename)."
+            row["note"] = "Failed during LED log matching."
+            return row
+
+        row["led_file"] = os.path.basename(led_path)
+        logger.info("Matched LED file: %s", os.path.basename(led_path))
+
+        # Load data; the HDF5 read and the LED log parse are independent, so overlap them
+        with ThreadPoolExecutor(max_workers=2) as loader:
+            digital_future = loader.submit(
+                DigitalEvents(mea_path).load, cfg.sync_duration_sec, cfg.post_stim_phase
+            )
+            arduino_future = loader.submit(ArduinoLEDLogs(led_path, cfg).load)
+            digital, arduino = digital_future.result(), arduino_future.result()
+
+        # Detect handshakes
+        handshake_pairs_led, start_names_led, stop_names_led = detector.find(
+            arduino.timestamps, tolerance=cfg.threshold
+        )
+
+        y_findings = find_yline_after_start_handshake(
+            arduino_linetypes=arduino.linetypes,
+            handshake_pairs=handshake_pairs_led,
+            byte_y=cfg.bytes["BYTE_Y"]
+        )
+        
+        # Because YLineErrors only occur in full stimulus blocks and never for just a number of lines
+        # after starting stimulation, this error is excepted and only logged as info!
+        # This choice was made because STAs and other analyses more easily ignore the full block instead
+        # of missing this information entirely.
+        if y_findings:
+            row["yline_error_found"] = True
+            row["yline_error_count"] = len(y_findings)
+            row["yline_error_details"] = y_findings
+            row["note"] = (row["note"] + " " if row["note"] else "") + \
+                        f"NOTE: YLineError detected after start handshake ({len(y_findings)} occurrence(s))."
+            logger.warning(
+                "YLineError: first post-start-handshake line is Y in %s case(s). Details: %s",
+                len(y_findings), y_findings
+            )
+
+        handshake_pairs_mea, start_names_mea, stop_names_mea = detector.find(
+            digital.timestamps, tolerance=cfg.threshold
+        )
+
+        logger.info("LED start handshake types: %s", start_names_led)
+        logger.info("LED stop handshake types: %s", stop_names_led)
+        logger.info("MEA start handshake types: %s", start_names_mea)
+        logger.info("MEA stop handshake types: %s", stop_names_mea)
+
+        # Trim handshake windows
+        stim_led_ts, trimmed_to_original_idx = trim_and_map(arduino.timestamps, handshake_pairs_led)
+        stim_mea_ts, _ = trim_and_map(digital.timestamps, handshake_pairs_mea)
+        logger.info("Stimulus-phase LED timestamps: %s", len(stim_led_ts))
+        logger.info("Stimulus-phase MEA timestamps: %s", len(stim_mea_ts))
+
+        # Determine expected diff from filename
+        expected_diff = extract_expected_diff_from_filename(mea_filename)
+        logger.info("Expected diff (µs) = %s", expected_diff)
+
+        # Detect anomalies
+        handler = AnomalyHandler(expected_diff=expected_diff,
+                                 threshold=cfg.threshold,
+                                 pause_threshold=300_000)
+        anomaly_idx, anomaly_codes = handler.detect_anomalies(stim_led_ts)
+        anomaly_counts = np.bincount(anomaly_codes, minlength=len(TYPE_NAMES))
+        logger.info("Anomalies detected: %s",
+                    {TYPE_NAMES[c]: int(n) for c, n in enumerate(anomaly_counts) if n})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Anomalies (index, type): %s",
+                         [(i, TYPE_NAMES[c]) for i, c in zip(anomaly_idx.tolist(), anomaly_codes.tolist())])
+
+        # Map anomalies back to original indices
+        remapped_idx = trimmed_to_original_idx[anomaly_idx]
+        logger.info("Remapped anomalies")
+
+        # Fix anomalies
+        fixer = AnomalyFixer(expected_diff=expected_diff,
+                             threshold=cfg.threshold,
+                             anomaly_indices=remapped_idx,
+                             anomaly_codes=anomaly_codes)
+        base_filename = os.path.splitext(mea_filename)[0]
+        output_npz = os.path.join(cfg.path_to_results, f"{base_filename}_corrected.npz")
+        correction_csv = os.path.join(cfg.path_to_results, f"{base_filename}_correction_log.csv")
+
+        fixer.fix(
+            arduino_ts=arduino.timestamps,
+            arduino_patterns=arduino.patterns,
+            arduino_linetypes=arduino.linetypes,
+            mea_ts=digital.timestamps,
+            output_npz_path=output_npz,
+            correction_log_path=correction_csv,
+            handshake_pairs=handshake_pairs_led,
+            start_names=start_names_led,
+            stop_names=stop_names_led,
+            log_format=cfg.correction_log_format
+        )
+
+        row["status"] = "success"
+        logger.info("Successfully processed %s", mea_filename)
+
+    except Exception as e:
+        logger.error("Error processing %s: %s", mea_filename, e)
+        logger.debug(traceback.format_exc())
+        row["status"] = "failed"
+        row["error_type"] = type(e).__name__
+        row["error_message"] = str(e)
+        return row
+
+    return row
+
+
 def main():
     # Load configuration
     cfg = SyncConfig.load("config.toml")
 
+    run_id = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    log_file = os.path.join(cfg.log_dir, f"sync_log_{run_id}.log")
+
     # Setup logging globally
-    logger = setup_logging(cfg.log_dir, cfg.log_level)
+    setup_logging(cfg.log_dir, cfg.log_level, log_file=log_file)
     logger.info("______________________")
     logger.info("Starting Sync Pipeline")
 
-    run_id = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    summary_rows = []
+    # Summary rows are streamed to disk as each file finishes, so partial runs keep their progress
+    summary_csv = os.path.join(cfg.log_dir, f"sync_summary_{run_id}.csv")
+    summary_json = os.path.join(cfg.log_dir, f"sync_summary_{run_id}.jsonl")
+    csv_file = open(summary_csv, "w", newline="", encoding="utf-8")
+    json_file = open(summary_json, "w", encoding="utf-8")
+    csv_writer = csv.DictWriter(csv_file, fieldnames=SUMMARY_FIELDNAMES)
+    csv_writer.writeheader()
+    n_rows = 0
+
+    def write_row(row: dict):
+        nonlocal n_rows
+        csv_writer.writerow(row)
+        json_file.write(json.dumps(row) + "\n")
+        csv_file.flush()
+        json_file.flush()
+        n_rows += 1
 
     try:
         # Iterate over MEA files
-        for mea_filename in os.listdir(cfg.path_h5_dir):
-            if not mea_filename.endswith(".h5"):
-                continue  # skip non-HDF5 files
-
-            mea_path = os.path.join(cfg.path_h5_dir, mea_filename)
-            logger.info(f"Processing MEA file: {mea_filename}")
-
-            row = {
-                "run_id": run_id,
-                "mea_file": mea_filename,
-                "mea_path": mea_path,
-                "led_file": None,
-                "status": "started",
-                "error_type": None,
-                "error_message": None,
-                "yline_error_found": False,
-                "yline_error_count": 0,
-                "yline_error_details": None,
-                "note": ""
-            }
-
-            try:
-                # RecID filtering
-                recid_str = next((part for part in mea_filename.split("_") if "RecID" in part), None)
-                if cfg.rec_id_start or cfg.rec_id_end:
-                    if not recid_str:
-                        logger.warning(f"No RecID in filename, skipping: {mea_filename}")
-                        row["status"] = "skipped"
-                        row["note"] = "Skipped: no RecID in filename."
-                        summary_rows.append(row)
-                        continue
-                    recid_num = int(recid_str.replace("RecID", "").replace("_", ""))
-                    if cfg.rec_id_start and recid_num < cfg.rec_id_start:
-                        row["status"] = "skipped"
-                        row["note"] = f"Skipped: RecID {recid_num} < rec_id_start {cfg.rec_id_start}."
-                        summary_rows.append(row)
-                        continue
-                    if cfg.rec_id_end and recid_num > cfg.rec_id_end:
-                        row["status"] = "skipped"
-                        row["note"] = f"Skipped: RecID {recid_num} > rec_id_end {cfg.rec_id_end}."
-                        summary_rows.append(row)
-                        continue
-
-                # Match LED file
+        with os.scandir(cfg.path_h5_dir) as entries:  # d_type from readdir, no stat per entry
+            mea_filenames = sorted(
+                e.name for e in entries if e.name.endswith(".h5") and e.is_file()
+            )
+        led_index = list_led_index(cfg.path_led_dir)  # RecID -> LED logs, one directory scan per run
+        detector = HandshakeDetector(cfg)
+
+        if cfg.workers > 1:
+            logger.info("Processing %s MEA files with %s workers", len(mea_filenames), cfg.workers)
+            with ProcessPoolExecutor(max_workers=cfg.workers,
+                                     initializer=init_worker,
+                                     initargs=(cfg.log_dir, cfg.log_level, log_file)) as ex:
                 try:
-                    led_path = match_led_file(mea_filename, cfg.path_led_dir)
-                except Exception as e:
-                    logger.error(f"Could not match LED file for {mea_filename}: {e}")
-                    row["status"] = "failed"
-                    row["error_type"] = type(e).__name__
-                    row["error_message"] = str(e)
-                    row["note"] = "Failed during LED log matching."
-                    summary_rows.append(row)
-                    continue
-
-                if not led_path:
-                    row["status"] = "failed"
-                    row["error_type"] = "LedLogNotFoundError"
-                    row["error_message"] = "match_led_file returned None (likely no RecID found in MEA filename)."
-                    row["note"] = "Failed during LED log matching."
-                    summary_rows.append(row)
-                    continue
-
-                row["led_file"] = os.path.basename(led_path)
-                logger.info(f"Matched LED file: {os.path.basename(led_path)}")
-
-                # Load data
-                digital = DigitalEvents(mea_path).load(cfg.sync_duration_sec, cfg.post_stim_phase)
-                arduino = ArduinoLEDLogs(led_path, cfg).load()
-
-                # Detect handshakes
-                detector = HandshakeDetector(cfg)
-                handshake_pairs_led, start_names_led, stop_names_led = detector.find(
-                    arduino.timestamps, tolerance=cfg.threshold
-                )
-
-                y_findings = find_yline_after_start_handshake(
-                    arduino_linetypes=arduino.linetypes,
-                    handshake_pairs=handshake_pairs_led,
-                    byte_y=cfg.bytes["BYTE_Y"]
-                )
-                
-                # Because YLineErrors only occur in full stimulus blocks and never for just a number of lines
-                # after starting stimulation, this error is excepted and only logged as info!
-                # This choice was made because STAs and other analyses more easily ignore the full block instead
-                # of missing this information entirely.
-                if y_findings:
-                    row["yline_error_found"] = True
-                    row["yline_error_count"] = len(y_findings)
-                    row["yline_error_details"] = y_findings
-                    row["note"] = (row["note"] + " " if row["note"] else "") + \
-                                f"NOTE: YLineError detected after start handshake ({len(y_findings)} occurrence(s))."
-                    logger.warning(
-                        f"YLineError: first post-start-handshake line is Y in {len(y_findings)} case(s). "
-                        f"Details: {y_findings}"
-                    )
-
-                handshake_pairs_mea, start_names_mea, stop_names_mea = detector.find(
-                    digital.timestamps, tolerance=cfg.threshold
-                )
-
-                logger.info(f"LED start handshake types: {start_names_led}")
-                logger.info(f"LED stop handshake types: {stop_names_led}")
-                logger.info(f"MEA start handshake types: {start_names_mea}")
-                logger.info(f"MEA stop handshake types: {stop_names_mea}")
-
-                # Trim handshake windows
-                stim_led_ts, trimmed_to_original_idx = trim_with_index_mapping(arduino.timestamps, handshake_pairs_led)
-                stim_mea_ts = trim_to_handshake_windows(digital.timestamps, handshake_pairs_mea)
-                logger.info(f"Stimulus-phase LED timestamps: {len(stim_led_ts)}")
-                logger.info(f"Stimulus-phase MEA timestamps: {len(stim_mea_ts)}")
-
-                # Determine expected diff from filename
-                expected_diff = extract_expected_diff_from_filename(mea_filename)
-                logger.info(f"Expected diff (µs) = {expected_diff}")
-
-                # Detect anomalies
-                handler = AnomalyHandler(expected_diff=expected_diff,
-                                         threshold=cfg.threshold,
-                                         pause_threshold=300_000)
-                anomalies = handler.detect_anomalies(stim_led_ts)
-                logger.info(f"Anomalies detected: {anomalies}")
-
-                # Map anomalies back to original indices
-                remapped_anomalies = [(trimmed_to_original_idx[trim_idx], anom_type)
-                                      for trim_idx, anom_type in anomalies]
-                logger.info(f"Remapped anomalies")
-
-                # Fix anomalies
-                fixer = AnomalyFixer(expected_diff=expected_diff,
-                                     threshold=cfg.threshold,
-                                     anomalies=remapped_anomalies)
-                base_filename = os.path.splitext(mea_filename)[0]
-                output_npz = os.path.join(cfg.path_to_results, f"{base_filename}_corrected.npz")
-                correction_csv = os.path.join(cfg.path_to_results, f"{base_filename}_correction_log.csv")
-
-                fixer.fix(
-                    arduino_ts=arduino.timestamps,
-                    arduino_patterns=arduino.patterns,
-                    arduino_linetypes=arduino.linetypes,
-                    mea_ts=digital.timestamps,
-                    output_npz_path=output_npz,
-                    correction_log_path=correction_csv,
-                    handshake_pairs=handshake_pairs_led,
-                    start_names=start_names_led,
-                    stop_names=stop_names_led
-                )
-
-                row["status"] = "success"
-                summary_rows.append(row)
-                logger.info(f"Successfully processed {mea_filename}")
-
-            except KeyboardInterrupt:
-                logger.warning("KeyboardInterrupt detected — stopping gracefully.")
-                break
-            except Exception as e:
-                logger.error(f"Error processing {mea_filename}: {e}")
-                logger.debug(traceback.format_exc())
-                row["status"] = "failed"
-                row["error_type"] = type(e).__name__
-                row["error_message"] = str(e)
-                summary_rows.append(row)
-                continue
+                    for row in ex.map(process_one, mea_filenames, repeat(cfg), repeat(run_id),
+                                      repeat(led_index), repeat(detector)):
+                        write_row(row)
+                except KeyboardInterrupt:
+                    ex.shutdown(cancel_futures=True)
+                    raise
+        else:
+            for mea_filename in mea_filenames:
+                write_row(process_one(mea_filename, cfg, run_id, led_index, detector))
 
     except KeyboardInterrupt:
         logger.warning("KeyboardInterrupt detected — shutting down gracefully.")
     finally:
-        os.makedirs(cfg.log_dir, exist_ok=True)
-        summary_csv = os.path.join(cfg.log_dir, f"sync_summary_{run_id}.csv")
-        summary_json = os.path.join(cfg.log_dir, f"sync_summary_{run_id}.json")
-
-        if summary_rows:
-            fieldnames = list(summary_rows[0].keys())
-            with open(summary_csv, "w", newline="", encoding="utf-8") as f:
-                w = csv.DictWriter(f, fieldnames=fieldnames)
-                w.writeheader()
-                w.writerows(summary_rows)
-
-            with open(summary_json, "w", encoding="utf-8") as f:
-                json.dump(summary_rows, f, indent=2)
-
-            logger.info(f"Wrote summary CSV:  {summary_csv}")
-            logger.info(f"Wrote summary JSON: {summary_json}")
+        csv_file.close()
+        json_file.close()
+
+        if n_rows:
+            logger.info("Wrote summary CSV:  %s", summary_csv)
+            logger.info("Wrote summary JSON: %s", summary_json)
         else:
-            logger.warning("No summary rows collected; nothing written.")
+            logger.warning("No summary rows collected; only the headers were written.")
 
         logger.info("_______________________")
         logger.info("Sync Pipeline Completed")
@@ -1,48 +1,72 @@
 import numpy as np
-from logging import getLogger
-from typing import List, Tuple, Dict
+from logging import DEBUG, getLogger
+from typing import List, Tuple, Dict, Optional
 from .exceptions import UnclassifiedAnomalyError, TimeDiffComparisonError
 
 logger = getLogger("syncing")
 
+# Anomaly type codes; TYPE_NAMES[code] is the name written to logs and CSVs
+TYPE_NAMES = ("normal", "overflow", "merge", "split_2", "split_3", "pause", "unclassified")
+NORMAL, OVERFLOW, MERGE, SPLIT_2, SPLIT_3, PAUSE, UNCLASSIFIED = range(len(TYPE_NAMES))
+
+def _classify(diffs: np.ndarray, expected_diff: int, threshold: int,
+              pause_threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Classifies timestamp diffs, returning (indices, int8 codes) of the non-normal ones.
+    Only the few diffs that fail the normal check go through the full rule cascade.
+    """
+    n = len(diffs)
+    idx = np.flatnonzero((diffs < 0) | (np.abs(diffs - expected_diff) > threshold))
+    d1 = diffs[idx]
+
+    # Sums over the next two/three diffs; truncated at the end like diffs[i:i+k]
+    d2 = d1 + np.where(idx + 1 < n, diffs[np.minimum(idx + 1, n - 1)], 0)
+    d3 = d2 + np.where(idx + 2 < n, diffs[np.minimum(idx + 2, n - 1)], 0)
+
+    codes = np.select(
+        [
+            d1 < 0,
+            np.abs(d1 - 2 * expected_diff) <= threshold,
+            np.abs(d2 - expected_diff) <= threshold,
+            np.abs(d3 - expected_diff) <= threshold,
+            d1 > pause_threshold,
+        ],
+        [OVERFLOW, MERGE, SPLIT_2, SPLIT_3, PAUSE],
+        default=UNCLASSIFIED,
+    ).astype(np.int8)
+    return idx, codes
+
+
 class AnomalyHandler:
     def __init__(self, expected_diff: int, threshold: int, pause_threshold: int = 300_000):
         self.expected_diff = expected_diff
         self.threshold = threshold
         self.pause_threshold = pause_threshold
 
-    def detect_anomalies(self, timestamps: np.ndarray) -> List[Tuple[int, str]]:
+    def detect_anomalies(self, timestamps: np.ndarray,
+                         diffs: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
         """
         Detect anomalies in Arduino timestamps relative to expected_diff.
-        Returns list of (index, anomaly_type).
+        Returns parallel arrays (indices, int8 type codes) of the non-normal diffs.
+        diffs: np.diff(timestamps), if the caller already has it
         """
-        diffs = np.diff(timestamps).astype(np.int64)
-        anomalies = []
-
-        for i, dt in enumerate(diffs):
-            if dt < 0:
-                logger.debug(f"Overflow at index {i}, fixing by adding 2**32")
-                diffs[i] += 2**32
-                anomalies.append((i, "overflow"))
-
-            elif abs(dt - self.expected_diff) <= self.threshold:
-                continue  # normal event
-
-            elif abs(dt - 2 * self.expected_diff) <= self.threshold:
-                anomalies.append((i, "merge"))
-
-            elif abs(sum(diffs[i:i+2]) - self.expected_diff) <= self.threshold:
-                anomalies.append((i, "split_2"))
-
-            elif abs(sum(diffs[i:i+3]) - self.expected_diff) <= self.threshold:
-                anomalies.append((i, "split_3"))
-
-            elif dt > self.pause_threshold:
-                anomalies.append((i, "pause"))
+        if diffs is None:
+            diffs = np.diff(timestamps)
+        diffs = diffs.astype(np.int64, copy=False)
+        anomaly_idx, anomaly_codes = _classify(
+            diffs, self.expected_diff, self.threshold, self.pause_threshold
+        )
 
-            else:
-                anomalies.append((i, "unclassified"))
-                logger.warning(f"Unclassified anomaly at {i}: dt={dt}")
+        # One summary line per type instead of a formatted message per anomaly
+        if logger.isEnabledFor(DEBUG):
+            overflow_idx = anomaly_idx[anomaly_codes == OVERFLOW]
+            if len(overflow_idx):
+                logger.debug("Overflow at %d indices, fixing by adding 2**32: %s",
+                             len(overflow_idx), overflow_idx.tolist())
+        unclassified_idx = anomaly_idx[anomaly_codes == UNCLASSIFIED]
+        if len(unclassified_idx):
+            logger.warning("%d unclassified anomalies (index, dt): %s", len(unclassified_idx),
+                           list(zip(unclassified_idx.tolist(), diffs[unclassified_idx].tolist())))
 
-        logger.info(f"Detected {len(anomalies)} anomalies")
-        return anomalies
\ No newline at end of file
+        logger.info("Detected %s anomalies", len(anomaly_idx))
+        return anomaly_idx, anomaly_codes
@@ -1,7 +1,8 @@
 # syncing/arduino_led.py
+import io
 import os
 import numpy as np
-from tqdm import tqdm
+import pandas as pd
 from logging import getLogger
 from .exceptions import LedLogNotFoundError, LedLogNoValidDataError
 from .config import SyncConfig
@@ -18,10 +19,14 @@ class ArduinoLEDLogs:
         """
         self.filepath = filepath
         self.bytes_cfg = cfg.bytes  # dict: {"BYTE_V": 86, "BYTE_W": 87, ...}
+        self._vwxy_bytes = np.array(
+            [cfg.bytes[k] for k in ("BYTE_V", "BYTE_W", "BYTE_X", "BYTE_Y")], dtype=np.uint8
+        )
+        self._byte_z = cfg.bytes["BYTE_Z"]
         self.timestamps: np.ndarray | None = None
-        self.patterns: list[list[int]] | None = None
-        self.linetypes: list[int] | None = None
-        self.multiplexing_lines: list[list] | None = None
+        self.patterns: np.ndarray | list[np.ndarray] | None = None
+        self.linetypes: np.ndarray | None = None
+        self.multiplexing_lines: list[np.ndarray] | None = None
 
     @staticmethod
     def parse_arduino_line(line: str) -> list[int]:
@@ -29,73 +34,129 @@ class ArduinoLEDLogs:
         return [int(entry) for entry in line.split(";")]
 
     @staticmethod
-    def compose_timestamp(row: list[int], multiplex: bool = False) -> np.uint64:
-        """Extracts timestamp from an Arduino log row."""
-        if not multiplex:
-            return np.frombuffer(bytes(row[1:5]), dtype=np.uint32)[0].astype(np.uint64)
-        else:
-            return np.frombuffer(bytes(row[5:9]), dtype=np.uint32)[0].astype(np.uint64)
+    def compose_timestamp(row: list[int], multiplex: bool = False) -> int:
+        """Extracts timestamp from an Arduino log row (little-endian uint32)."""
+        o = 5 if multiplex else 1
+        return row[o] | (row[o + 1] << 8) | (row[o + 2] << 16) | (row[o + 3] << 24)
+
+    @staticmethod
+    def compose_timestamps(byte_cols: np.ndarray) -> np.ndarray:
+        """Vectorized compose_timestamp: (n, 4) little-endian byte columns -> int64 timestamps."""
+        b = byte_cols.astype(np.int64)
+        return b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16) | (b[:, 3] << 24)
+
+    def check_bytes(self, byte_cols: np.ndarray):
+        """Raises if any timestamp byte is outside 0..255."""
+        if len(byte_cols) and (byte_cols.min() < 0 or byte_cols.max() > 255):
+            raise ValueError(f"Timestamp byte outside 0..255 in LED log {self.filepath}")
+
+    @staticmethod
+    def read_rows(filepath: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Bulk-parses a semicolon-separated log into a 2-D int array.
+
+        Returns:
+            rows: (n_lines, max_fields) array, short lines padded with -1
+            row_lengths: number of fields per line
+        """
+        with open(filepath, 'rb') as file:
+            raw = file.read()
+        if not raw.strip():
+            return np.empty((0, 1), dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        # Fields are parsed as floats (to pad short lines with NaN), so reject anything but integers first
+        stray = raw.translate(None, b"0123456789;+- \t\r\n")
+        if stray:
+            raise ValueError(f"Non-integer field in LED log {filepath}: unexpected {stray[:10]!r}")
+
+        # Field count per line from its separators; the widest line decides the CSV column count
+        lines = raw.splitlines()
+        row_lengths = np.array([line.count(b";") for line in lines], dtype=np.int64) + 1
+        n_fields = int(row_lengths.max())
+
+        values = pd.read_csv(
+            io.BytesIO(raw), sep=";", header=None, names=range(n_fields),
+            dtype=np.float32, engine="c", keep_default_na=False, na_values=[""]
+        ).to_numpy()
+
+        # read_csv skips blank lines, and empty fields come back as NaN: both are corrupt lines
+        if len(values) != len(lines):
+            raise ValueError(f"Blank line in LED log: {filepath}")
+        missing = np.isnan(values)
+        corrupt = np.flatnonzero((missing & (np.arange(n_fields) < row_lengths[:, None])).any(axis=1))
+        if len(corrupt):
+            raise ValueError(
+                f"{len(corrupt)} line(s) with empty fields in LED log {filepath}, "
+                f"first at line {corrupt[0] + 1}"
+            )
+        values[missing] = -1
+        return values.astype(np.int64), row_lengths
 
     def load(self):
         """Reads LED log and extracts timestamps, patterns, linetypes, multiplexing lines."""
-        logger.info(f"Loading Arduino LED log: {self.filepath}")
+        logger.info("Loading Arduino LED log: %s", self.filepath)
 
         if not os.path.isfile(self.filepath):
             raise LedLogNotFoundError(f"LED log file not found: {self.filepath}")
 
-        timestamps = []
-        byte_patterns = []
-        linetypes = []
-        multiplex_blocks = []
-        current_mp_block = []
-
         try:
-            with open(self.filepath, 'r') as file:
-                for line in tqdm(file, desc=f"Reading {os.path.basename(self.filepath)}"):
-                    row = self.parse_arduino_line(line.strip())
-                    last_byte = row[-1]
-
-                    # Pattern lines (V, W, X, Y types)
-                    if last_byte in {
-                        self.bytes_cfg["BYTE_V"],
-                        self.bytes_cfg["BYTE_W"],
-                        self.bytes_cfg["BYTE_X"],
-                        self.bytes_cfg["BYTE_Y"],
-                    }:
-                        timestamps.append(self.compose_timestamp(row))
-                        byte_patterns.append(row[6:-1])
-                        linetypes.append(last_byte)
-
-                        multiplex_blocks.append(current_mp_block)
-                        current_mp_block = []
-
-                    # Multiplexing lines (Z type)
-                    elif last_byte == self.bytes_cfg["BYTE_Z"]:
-                        if len(row) != 16:
-                            logger.debug(f"Skipping malformed Z-line: {row}")
-                            continue
-                        ft_int = np.frombuffer(bytes(row[1:5]), dtype=np.uint32)[0].astype(np.uint64)
-                        st_int = np.frombuffer(bytes(row[5:9]), dtype=np.uint32)[0].astype(np.uint64)
-                        index_byte = int(row[9])
-                        mp_entry = [ft_int, st_int, index_byte]
-                        current_mp_block.append(mp_entry)
-
-                    else:
-                        # Ignore all other line types
-                        continue
-
+            rows, row_lengths = self.read_rows(self.filepath)
         except Exception as e:
-            logger.exception(f"Error while parsing LED log: {self.filepath}")
+            logger.exception("Error while parsing LED log: %s", self.filepath)
             raise
 
-        if not timestamps:
-            raise LedLogNoValidDataError(f"No valid LED timestamps in Arduino log: {self.filepath}")
+        last_bytes = rows[np.arange(len(rows)), row_lengths - 1]
 
-        logger.info(f"Extracted {len(timestamps)} LED timestamps from {self.filepath}")
+        # Pattern lines (V, W, X, Y types)
+        mask_vwxy = np.isin(last_bytes, self._vwxy_bytes)
+        if not mask_vwxy.any():
+            raise LedLogNoValidDataError(f"No valid LED timestamps in Arduino log: {self.filepath}")
 
-        self.timestamps = np.array(timestamps, dtype=np.int64)
+        vwxy_rows = rows[mask_vwxy]
+        vwxy_lengths = row_lengths[mask_vwxy]
+        # Shorter lines have no pattern bytes and would read the -1 padding as timestamp bytes
+        short = np.flatnonzero(vwxy_lengths < 7)
+        if len(short):
+            raise ValueError(
+                f"{len(short)} pattern line(s) too short in LED log {self.filepath}, "
+                f"first at line {np.flatnonzero(mask_vwxy)[short[0]] + 1}"
+            )
+
+        self.check_bytes(vwxy_rows[:, 1:5])
+        timestamps = self.compose_timestamps(vwxy_rows[:, 1:5])
+        # Pattern bytes as one (n_lines, width) uint8 array; ragged logs fall back to per-line arrays
+        if (vwxy_lengths == vwxy_lengths[0]).all():
+            byte_patterns = vwxy_rows[:, 6:vwxy_lengths[0] - 1].astype(np.uint8)
+        else:
+            logger.warning("Pattern lines of differing widths in %s, keeping per-line patterns", self.filepath)
+            byte_patterns = [row[6:n - 1].astype(np.uint8) for row, n in zip(vwxy_rows, vwxy_lengths)]
+        linetypes = last_bytes[mask_vwxy].astype(np.uint8)
+
+        # Multiplexing lines (Z type), grouped into the block preceding each pattern line
+        mask_z = last_bytes == self._byte_z
+        n_malformed = np.count_nonzero(mask_z & (row_lengths != 16))
+        if n_malformed:
+            logger.debug("Skipping %s malformed Z-lines", n_malformed)
+        mask_z &= row_lengths == 16
+
+        mp_entries = np.empty((np.count_nonzero(mask_z), 3), dtype=np.int64)
+        if len(mp_entries):
+            z_rows = rows[mask_z]
+            self.check_bytes(z_rows[:, 1:9])
+            mp_entries[:, 0] = self.compose_timestamps(z_rows[:, 1:5])
+            mp_entries[:, 1] = self.compose_timestamps(z_rows[:, 5:9])
+            mp_entries[:, 2] = z_rows[:, 9]
+
+        # Number of pattern lines seen before each Z-line; trailing Z-lines have no block
+        block_ids = np.cumsum(mask_vwxy)[mask_z]
+        bounds = np.searchsorted(block_ids, np.arange(len(timestamps) + 1)).tolist()
+        multiplex_blocks = [mp_entries[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+        logger.info("Extracted %s LED timestamps from %s", len(timestamps), self.filepath)
+
+        self.timestamps = timestamps
         self.patterns = byte_patterns
         self.linetypes = linetypes
         self.multiplexing_lines = multiplex_blocks
 
-        return self
\ No newline at end of file
+        return self
@@ -17,6 +17,8 @@ class SyncConfig:
     log_level: str
     sync_duration_sec: float
     post_stim_phase: Optional[float]
+    workers: int
+    correction_log_format: str
 
     # Arduino bytes
     bytes: Dict[str, int]
@@ -32,6 +34,10 @@ class SyncConfig:
         paths = cfg["paths"]
         params = cfg["parameters"]
 
+        log_format = params.get("correction_log_format", "csv")
+        if log_format not in ("csv", "parquet"):
+            raise ValueError(f"correction_log_format must be 'csv' or 'parquet', got {log_format!r}")
+
         return cls(
             # Paths
             path_led_dir=paths["path_led_dir"],
@@ -46,6 +52,8 @@ class SyncConfig:
             log_level=params.get("log_level", "INFO"),
             sync_duration_sec=float(params.get("sync_duration_sec", 9)),
             post_stim_phase=(float(params["post_stim_phase"]) if params.get("post_stim_phase") else None),
+            workers=int(params.get("workers", 1)),
+            correction_log_format=log_format,
 
             # Arduino bytes
             bytes=cfg["arduino"]["bytes"],
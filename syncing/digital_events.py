@@ -1,41 +1,82 @@
 import h5py
 import numpy as np
 from logging import getLogger
-from .exceptions import DENotFound
+from typing import Tuple
+from .exceptions import DENotFound, DEIndexSizeError
 
 logger = getLogger("syncing")
 
+STREAM_HIGH = '/Data/Recording_0/EventStream/Stream_0/EventEntity_0'
+STREAM_LOW = '/Data/Recording_0/EventStream/Stream_1/EventEntity_0'
+
+def sorted_row_index(ds: h5py.Dataset, value: float, side: str = "left", prefix_len: int = 1024) -> int:
+    """
+    np.searchsorted on the (ascending) first row of a 2-D dataset without reading the whole row.
+    Looks in a short prefix first and bisects the remainder with single-element reads.
+    """
+    n = ds.shape[1]
+    prefix = ds[0, :min(prefix_len, n)]
+    idx = int(np.searchsorted(prefix, value, side=side))
+    if idx < len(prefix) or len(prefix) == n:
+        return idx
+
+    lo, hi = len(prefix), n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        v = ds[0, mid]
+        if v < value or (side == "right" and v == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
 class DigitalEvents:
     def __init__(self, filepath: str):
         self.filepath = filepath
         self.timestamps = None
 
+    @staticmethod
+    def window_bounds(ds: h5py.Dataset, after_us: float, before_us: float = None) -> Tuple[int, int]:
+        """Index range [start, stop) of the event timestamps in (after_us, before_us)."""
+        start = sorted_row_index(ds, after_us, side="right")
+        stop = sorted_row_index(ds, before_us, side="left") if before_us else ds.shape[1]
+        return start, max(start, stop)
+
     def load(self, sync_duration_sec: float = 9, post_stim_phase: float = None):
-        logger.info(f"Loading digital events from {self.filepath}")
+        logger.info("Loading digital events from %s", self.filepath)
         try:
             f = h5py.File(self.filepath, 'r')
         except (FileNotFoundError, OSError) as e:
             raise DENotFound(f"Digital events file not found: {self.filepath}") from e
 
-        d_h = np.array(f['/Data/Recording_0/EventStream/Stream_0/EventEntity_0'][0], dtype=np.int64)
-        d_l = np.array(f['/Data/Recording_0/EventStream/Stream_1/EventEntity_0'][0], dtype=np.int64)
-
-        d_h = d_h[d_h > sync_duration_sec * 1e6]
-        d_l = d_l[d_l > sync_duration_sec * 1e6]
-
+        # Events are stored in ascending time order, so the sync/post-stim cuts are index ranges
+        before_us = None
         if post_stim_phase:
             logger.debug("Trimming events beyond post-stim phase")
-            d_h = d_h[d_h < post_stim_phase * 1e6]
-            d_l = d_l[d_l < post_stim_phase * 1e6]
+            before_us = post_stim_phase * 1e6
+
+        with f:
+            ds_h, ds_l = f[STREAM_HIGH], f[STREAM_LOW]
+            h_start, h_stop = self.window_bounds(ds_h, sync_duration_sec * 1e6, before_us)
+            l_start, l_stop = self.window_bounds(ds_l, sync_duration_sec * 1e6, before_us)
+            n_h, n_l = h_stop - h_start, l_stop - l_start
+            if not n_h or not n_l:
+                raise DEIndexSizeError(f"No high/low digital events after sync phase: high={n_h}, low={n_l}")
+
+            # Edges alternate; the stream with the earlier first event takes the even slots
+            high_first = ds_h[0, h_start] < ds_l[0, l_start]
+            if not high_first:
+                logger.info("Digital events start with low value")
+            n_first, n_second = (n_h, n_l) if high_first else (n_l, n_h)
+            if n_first - n_second not in (0, 1):
+                raise DEIndexSizeError(f"High/low digital events do not interleave: high={n_h}, low={n_l}")
+
+            # HDF5 writes each stream straight into its strided slots of the output
+            d_e = np.empty((n_h + n_l,), dtype=np.int64)
+            ds_h.read_direct(d_e, source_sel=np.s_[0, h_start:h_stop],
+                             dest_sel=np.s_[0 if high_first else 1::2])
+            ds_l.read_direct(d_e, source_sel=np.s_[0, l_start:l_stop],
+                             dest_sel=np.s_[1 if high_first else 0::2])
 
-        d_e = np.empty((d_h.size + d_l.size,), dtype=np.int64)
-        if d_h[0] < d_l[0]:
-            d_e[0::2] = d_h
-            d_e[1::2] = d_l
-        else:
-            logger.info("Digital events start with low value")
-            d_e[1::2] = d_h
-            d_e[0::2] = d_l
-        
         self.timestamps = d_e
-        return self
\ No newline at end of file
+        return self
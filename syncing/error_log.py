@@ -1,13 +1,14 @@
 import os
+import numpy as np
 import pandas as pd
-from collections import Counter
+from .anomalies import TYPE_NAMES
 
 def write_error_log(log_dir: str,
                     base_name: str,
                     handshake_pairs,
                     start_names,
                     stop_names,
-                    anomalies,
+                    anomaly_codes,
                     index_offset_series=None):
     
     os.makedirs(log_dir, exist_ok=True)
@@ -47,8 +48,11 @@ def write_error_log(log_dir: str,
         hs_rows.append(row)
 
     # anomaly summary counts
-    anomaly_counts = Counter([t for _, t in anomalies])
-    anomaly_rows = [{"anomaly_type": k, "count": v} for k, v in sorted(anomaly_counts.items())]
+    anomaly_counts = np.bincount(anomaly_codes, minlength=len(TYPE_NAMES))
+    anomaly_rows = sorted(
+        ({"anomaly_type": TYPE_NAMES[code], "count": int(n)} for code, n in enumerate(anomaly_counts) if n),
+        key=lambda r: r["anomaly_type"]
+    )
 
     # write files
     hs_path = os.path.join(log_dir, f"{base_name}_handshake_summary.csv")
@@ -1,47 +1,115 @@
 import os
 import re
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Optional
 from .exceptions import LedLogNotFoundError, LedLogNameMismatchError
 from logging import getLogger
 
 logger = getLogger("syncing")
 
+_HS_RE = re.compile(r"HS\d+")
+_MS_RE = re.compile(r"(\d+(?:p\d+|\.\d+)?)ms")
+_RECID_RE = re.compile(r"RecID[-_]?(\d+)")
+
 def extract_hs_id(filename: str) -> str:
-    match = re.search(r'HS\d+', filename)
+    match = _HS_RE.search(filename)
     return match.group(0) if match else 'UNKNOWN'
 
+def extract_recid(filename: str) -> Optional[int]:
+    """Returns the numeric RecID of a filename, or None if it has none."""
+    match = _RECID_RE.search(filename)
+    return int(match.group(1)) if match else None
+
 def extract_expected_diff_from_filename(filename: str) -> int:
-    match = re.search(r"(\d+(?:p\d+|\.\d+)?)ms", filename)
+    match = _MS_RE.search(filename)
     if not match:
-        logger.warning(f"No timestep found in filename {filename}, default 62.5 ms")
+        logger.warning("No timestep found in filename %s, default 62.5 ms", filename)
         return 62500
     milliseconds = float(match.group(1).replace("p", "."))
     return int(milliseconds * 1000)
 
-def match_led_file(de_filename: str, path_led_dir: str, neighborhood: int = 2) -> str:
-    logger.debug(f"Matching LED log for {de_filename}")
-    recid_match = re.search(r"RecID[-_]?(\d+)", de_filename)
+@dataclass
+class LedIndex:
+    # RecID digit string (as written in the filename) -> LED logs carrying it, in listing order
+    by_recid: Dict[str, List[str]]
+    # Sorted numeric RecIDs whose digit string is the zero-padded form used for lookups
+    recids: np.ndarray
+
+    def neighbor(self, recid: int, neighborhood: int) -> Optional[str]:
+        """First LED log (lowest RecID) within recid ± neighborhood, or None."""
+        lo = np.searchsorted(self.recids, recid - neighborhood)
+        if lo < len(self.recids) and self.recids[lo] <= recid + neighborhood:
+            return self.by_recid[str(self.recids[lo]).zfill(3)][0]
+        return None
+
+def index_led_files(led_files: List[str]) -> LedIndex:
+    """
+    Indexes LED logs by RecID, so lookups are a dict access (or a binary search for
+    neighbours) instead of a regex scan of the directory.
+    """
+    by_recid = {}
+    for name in led_files:
+        for recid in dict.fromkeys(_RECID_RE.findall(name)):
+            by_recid.setdefault(recid, []).append(name)
+    recids = np.array(sorted(int(r) for r in by_recid if str(int(r)).zfill(3) == r), dtype=np.int64)
+    return LedIndex(by_recid, recids)
+
+def list_led_index(path_led_dir: str) -> LedIndex:
+    """Scans path_led_dir once and indexes its entries by RecID."""
+    with os.scandir(path_led_dir) as entries:
+        return index_led_files(sorted(e.name for e in entries))
+
+def match_led_file(de_filename: str,
+                   path_led_dir: str,
+                   neighborhood: int = 2,
+                   led_index: Optional[LedIndex] = None) -> str:
+    """
+    Finds the LED log matching the RecID of a DE file, falling back to neighbouring RecIDs.
+    led_index: precomputed list_led_index() result, so batches scan the directory only once;
+               without it path_led_dir is scanned on every call (see match_led_files).
+    """
+    logger.debug("Matching LED log for %s", de_filename)
+    recid_match = _RECID_RE.search(de_filename)
     if not recid_match:
-        logger.info(f"No RecID found in {de_filename}, skipping")
+        logger.info("No RecID found in %s, skipping", de_filename)
         return None
 
+    if led_index is None:
+        led_index = list_led_index(path_led_dir)
+
     recid_num = recid_match.group(1).zfill(3)
-    led_candidates = [f for f in os.listdir(path_led_dir) if re.search(rf"RecID[-_]?{recid_num}(?!\d)", f)]
+    led_candidates = led_index.by_recid.get(recid_num, [])
 
     if len(led_candidates) == 1:
-        logger.debug(f"Found single candidate LED log: {led_candidates[0]}")
+        logger.debug("Found single candidate LED log: %s", led_candidates[0])
         return os.path.join(path_led_dir, led_candidates[0])
 
     if len(led_candidates) > 1:
-        logger.warning(f"Multiple LED logs for RecID {recid_num}, taking first match")
+        logger.warning("Multiple LED logs for RecID %s, taking first match", recid_num)
         return os.path.join(path_led_dir, led_candidates[0])
 
-    logger.warning(f"No LED log found for RecID {recid_num}, checking neighbors")
-    for offset in range(-neighborhood, neighborhood + 1):
-        neighbor = str(int(recid_num) + offset).zfill(3)
-        neighbor_candidates = [
-            f for f in os.listdir(path_led_dir) if re.search(rf"RecID[-_]?{neighbor}(?!\d)", f)
-        ]
-        if neighbor_candidates:
-            return os.path.join(path_led_dir, neighbor_candidates[0])
+    logger.warning("No LED log found for RecID %s, checking neighbors", recid_num)
+    neighbor_match = led_index.neighbor(int(recid_num), neighborhood)
+    if neighbor_match:
+        return os.path.join(path_led_dir, neighbor_match)
+
+    raise LedLogNotFoundError(f"No LED log found for RecID-{recid_num} or neighbors.")
 
-    raise LedLogNotFoundError(f"No LED log found for RecID-{recid_num} or neighbors.")
\ No newline at end of file
+def match_led_files(de_filenames: List[str],
+                    path_led_dir: str,
+                    neighborhood: int = 2) -> Dict[str, Optional[str]]:
+    """
+    Batch version of match_led_file: lists path_led_dir once and resolves every DE file
+    against the in-memory index. Files without RecID or without any LED log map to None.
+    """
+    led_index = list_led_index(path_led_dir)
+    matches = {}
+    for de_filename in de_filenames:
+        try:
+            matches[de_filename] = match_led_file(de_filename, path_led_dir, neighborhood,
+                                                  led_index=led_index)
+        except LedLogNotFoundError as e:
+            logger.warning(str(e))
+            matches[de_filename] = None
+    return matches
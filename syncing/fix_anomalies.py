@@ -2,10 +2,30 @@ import numpy as np
 import pandas as pd
 import os
 from logging import getLogger
-from typing import List, Tuple, Dict, Optional
+from typing import List, Tuple, Optional
+from .anomalies import TYPE_NAMES, NORMAL, MERGE, SPLIT_2, SPLIT_3
 
 logger = getLogger("syncing")
 
+# Anomaly codes that shift the LED/MEA alignment; every other code maps one LED line to one MEA event
+_REALIGNING = (MERGE, SPLIT_2, SPLIT_3)
+
+# Categories of the correction log's string columns; the log stores their codes
+_ANOMALY_CATEGORIES = TYPE_NAMES + ("not_fixed_due_to_error",)
+_NOT_FIXED = len(TYPE_NAMES)
+_PHASE_NAMES = ("none", "start_handshake", "stop_handshake")
+_START_HANDSHAKE, _STOP_HANDSHAKE = 1, 2
+
+def load_patterns(npz) -> List[np.ndarray]:
+    """
+    Splits the flat patterns of a corrected .npz back into one array per line.
+    Files written before patterns_offsets existed hold a pickled object array instead.
+    """
+    if "patterns_offsets" not in npz:
+        return list(npz["patterns"])
+    offsets = npz["patterns_offsets"]
+    return np.split(npz["patterns"], offsets[1:-1])
+
 class AnomalyFixer:
     """
     Corrects anomalies detected in Arduino LED logs and produces:
@@ -14,59 +34,115 @@ class AnomalyFixer:
     """
 
     def __init__(self,
-                 anomalies: List[Tuple[int, str]],
+                 anomaly_indices: np.ndarray,
+                 anomaly_codes: np.ndarray,
                  expected_diff: int,
                  threshold: int):
-        self.anomalies = anomalies
+        """
+        anomaly_indices: timestamp indices of the anomalies (into arduino_ts passed to fix())
+        anomaly_codes: anomaly type code per index (see anomalies.TYPE_NAMES), parallel to anomaly_indices
+        """
+        self.anomaly_indices = anomaly_indices
+        self.anomaly_codes = anomaly_codes
         self.expected_diff = expected_diff
         self.threshold = threshold
 
+    @staticmethod
+    def write_log(df: pd.DataFrame, csv_path: str, log_format: str) -> str:
+        """Writes the correction log as CSV or parquet and returns the path written."""
+        if log_format == "parquet":
+            parquet_path = os.path.splitext(csv_path)[0] + ".parquet"
+            try:
+                df.to_parquet(parquet_path, index=False, compression="zstd")
+                return parquet_path
+            except ImportError:
+                logger.warning("pyarrow not available, writing correction log as CSV")
+        elif log_format != "csv":
+            raise ValueError(f"Unknown correction log format: {log_format}")
+        df.to_csv(csv_path, index=False)
+        return csv_path
+
     def fix(self,
          arduino_ts: np.ndarray,
-         arduino_patterns: List[List[int]],
-         arduino_linetypes: List[int],
+         arduino_patterns: np.ndarray,
+         arduino_linetypes: np.ndarray,
          mea_ts: np.ndarray,
          output_npz_path: str,
          correction_log_path: str,
          handshake_pairs: Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]] = None,
          start_names=None,
-         stop_names=None
+         stop_names=None,
+         log_format: str = "csv"
          ) -> None:
         """
         Fix anomalies and produce npz + correction log.
 
         handshake_pairs: list of ((start_begin, start_end), (stop_begin, stop_end)) in diff-index coords
                         From HandshakeDetector.find() if you want to mark those lines in the log.
+        log_format: "csv" or "parquet"; parquet is written next to correction_log_path
+                    with a .parquet suffix and falls back to CSV if pyarrow is missing.
         """
         logger.info("Starting anomaly fixing...")
 
-        anomaly_map: Dict[int, str] = {idx: t for idx, t in self.anomalies}
+        n_ts = len(arduino_ts)
+
+        # Anomaly code per timestamp index; indices without an anomaly stay NORMAL
+        in_range = self.anomaly_indices < n_ts
+        codes = np.full(n_ts, NORMAL, dtype=np.int8)
+        codes[self.anomaly_indices[in_range]] = self.anomaly_codes[in_range]
+        anomaly_map = codes.tolist()
 
-        handshake_map: Dict[int, str] = {}
+        # Handshake phase per timestamp index as a _PHASE_NAMES code
+        phase = np.zeros(n_ts, dtype=np.int8)
         if handshake_pairs:
             for (start_range, stop_range) in handshake_pairs:
-                start_ts_indices = range(start_range[0], start_range[1]+1)
-                stop_ts_indices = range(stop_range[0], stop_range[1]+1)
-                for idx in start_ts_indices:
-                    handshake_map[idx] = "start_handshake"
-                for idx in stop_ts_indices:
-                    handshake_map[idx] = "stop_handshake"
-
-        offset = 0
-        overflow_info = []
-        for idx in range(len(arduino_ts)):
-            if idx > 0 and arduino_ts[idx] < arduino_ts[idx - 1]:
-                offset += 2**32
-                overflow_flag = True
-                # logger.debug(f"Arduino overflow detected at index {idx}, adding offset {offset}")
-            else:
-                overflow_flag = False
-            arduino_ts[idx] += offset
-            overflow_info.append((overflow_flag, offset))
-
-        corrected_ts = []
-        corrected_patterns = []
-        correction_records = []
+                phase[start_range[0]:start_range[1] + 1] = _START_HANDSHAKE
+                phase[stop_range[0]:stop_range[1] + 1] = _STOP_HANDSHAKE
+        resets_offset = (phase == _START_HANDSHAKE).tolist()
+
+        # Every backwards step of the 32-bit Arduino clock adds another 2**32 from there on
+        arduino_ts = np.asarray(arduino_ts, dtype=np.int64)
+        overflow_flags = np.zeros(len(arduino_ts), dtype=bool)
+        overflow_flags[1:] = np.diff(arduino_ts) < 0
+        overflow_offsets = np.cumsum(overflow_flags, dtype=np.int64) << 32
+        arduino_ts = arduino_ts + overflow_offsets
+
+        # Splits emit one (split_2) or two (split_3) extra lines on top of one line per timestamp
+        n_out = n_ts + np.count_nonzero(codes == SPLIT_2) + 2 * np.count_nonzero(codes == SPLIT_3)
+        corrected_ts = np.empty(n_out, dtype=np.int64)
+        pattern_src = np.empty(n_out, dtype=np.int64)  # arduino_patterns row behind each output line
+        out = 0
+
+        # Correction log, one row per output line, kept as columns; the per-timestamp
+        # fields (index, timestamp, linetype, ...) are gathered from row_src at the end
+        row_src = np.empty(n_out, dtype=np.int64)
+        row_corr_ts = np.empty(n_out, dtype=np.int64)
+        row_mea_idx = np.empty(n_out, dtype=np.int64)
+        row_skip = np.zeros(n_out, dtype=np.int64)
+        row_extra = np.zeros(n_out, dtype=np.int64)
+        row_index_offset = np.empty(n_out, dtype=np.int64)
+        row_d_orig = np.full(n_out, np.nan)
+        row_d_corr = np.full(n_out, np.nan)
+        row_d_change = np.full(n_out, np.nan)
+        n_rows = 0
+
+        def add_row(i, corr_ts, mea_idx, index_offset, skip=0, extra=0,
+                    d_orig=None, d_corr=None, d_change=None):
+            """Appends one correction-log row; a None delta stays empty in the CSV."""
+            nonlocal n_rows
+            row_src[n_rows] = i
+            row_corr_ts[n_rows] = corr_ts
+            row_mea_idx[n_rows] = mea_idx
+            row_index_offset[n_rows] = index_offset
+            row_skip[n_rows] = skip
+            row_extra[n_rows] = extra
+            if d_orig is not None:
+                row_d_orig[n_rows] = d_orig
+            if d_corr is not None:
+                row_d_corr[n_rows] = d_corr
+            if d_change is not None:
+                row_d_change[n_rows] = d_change
+            n_rows += 1
 
         d_e_index = 0
         prev_orig_ts = None
@@ -76,70 +152,71 @@ class AnomalyFixer:
 
         success = True
 
+        # Plain int lists: indexing them in the loop avoids boxing a NumPy scalar per access
+        ts_list = arduino_ts.tolist()
+        # ts_diff[i] = ts[i] - ts[i - 1]; index 0 wraps to the last line like ts_list[i - 1] does
+        ts_diff = np.diff(arduino_ts, prepend=arduino_ts[-1:]).tolist()
+        mea_list = np.asarray(mea_ts).tolist()
+        n_lines = min(n_ts, len(arduino_patterns), len(arduino_linetypes))
+
+        # Lines before the first merge/split each take the next MEA event, so that stretch
+        # (the whole log when nothing needs realigning) is filled without the per-line loop
+        realigning = np.flatnonzero(np.isin(codes[:n_lines], _REALIGNING))
+        n_aligned = min(int(realigning[0]) if len(realigning) else n_lines, len(mea_list))
+        if n_aligned:
+            aligned = np.arange(n_aligned)
+            corrected_ts[:n_aligned] = np.asarray(mea_ts)[:n_aligned]
+            pattern_src[:n_aligned] = aligned
+            row_src[:n_aligned] = aligned
+            row_mea_idx[:n_aligned] = aligned
+            row_corr_ts[:n_aligned] = corrected_ts[:n_aligned]
+            row_index_offset[:n_aligned] = 0
+            d_orig = np.diff(arduino_ts[:n_aligned])
+            d_corr = np.diff(corrected_ts[:n_aligned])
+            row_d_orig[1:n_aligned] = d_orig
+            row_d_corr[1:n_aligned] = d_corr
+            row_d_change[1:n_aligned] = d_corr - d_orig
+
+            out = n_rows = d_e_index = n_aligned
+            prev_orig_ts = ts_list[n_aligned - 1]
+            prev_corr_ts = mea_list[n_aligned - 1]
+
         try: 
-            for i, (orig_ts, pat, lt) in enumerate(zip(arduino_ts, arduino_patterns, arduino_linetypes)):
-                anomaly_type = anomaly_map.get(i, None)
-                
-                record = {
-                    "original_index": i,
-                    "original_timestamp": orig_ts,
-                    "original_linetype": lt,
-                    "anomaly_type": anomaly_type if anomaly_type else "normal",
-                    "handshake_phase": handshake_map.get(i, "none"),
-                    "overflow_fix": overflow_info[i][0],
-                    "overflow_offset": overflow_info[i][1],
-                    "mea_indices_used": [],
-                    "skip_count": 0,
-                    "extra_inserts": 0,
-                    "delta_original": None,
-                    "delta_corrected": None,
-                    "delta_diff_change": None,
-                    "index_offset": index_offset   
-                }
-            
-                if record["handshake_phase"] == "start_handshake":
+            for i in range(n_aligned, n_lines):
+                orig_ts = ts_list[i]
+                anomaly_type = anomaly_map[i]
+
+                if resets_offset[i]:
                     index_offset = 0
-                record["index_offset"] = index_offset        
+                row_offset = index_offset
 
-                if prev_orig_ts is not None:
-                    record["delta_original"] = orig_ts - prev_orig_ts
+                delta_original = orig_ts - prev_orig_ts if prev_orig_ts is not None else None
 
-                if anomaly_type is None:
-                    corr_ts = mea_ts[d_e_index]
-                    record["mea_indices_used"].append(d_e_index)
+                if anomaly_type not in _REALIGNING:
+                    # normal, overflow, pause, unclassified: one MEA event per LED line
+                    corr_ts = mea_list[d_e_index]
+                    mea_idx, skip = d_e_index, 0
                     d_e_index += 1
 
-                elif anomaly_type == "merge":
-                    corr_ts = mea_ts[d_e_index]
-                    record["mea_indices_used"].append(d_e_index)
-                    record["skip_count"] = 1
+                elif anomaly_type == MERGE:
+                    corr_ts = mea_list[d_e_index]
+                    mea_idx, skip = d_e_index, 1
                     d_e_index += 2
                     index_offset -= 1
 
-                elif anomaly_type == "split_2":
-                    first_corr_ts = mea_ts[d_e_index - 1] + (orig_ts - arduino_ts[i - 1])
-                    corrected_ts.append(first_corr_ts)
-                    corrected_patterns.append(pat)
-                    correction_records.append({
-                        **record,
-                        "corrected_timestamp": first_corr_ts,
-                        "extra_inserts": 1,
-                        "mea_indices_used": [d_e_index - 1],
-                        "delta_original": record["delta_original"],
-                        "delta_corrected": (first_corr_ts - prev_corr_ts) if prev_corr_ts is not None else None
-                    })
-
-                    second_corr_ts = mea_ts[d_e_index]
-                    corrected_ts.append(second_corr_ts)
-                    corrected_patterns.append(arduino_patterns[i + 1])
-                    correction_records.append({
-                        **record,
-                        "corrected_timestamp": second_corr_ts,
-                        "extra_inserts": 0,
-                        "mea_indices_used": [d_e_index],
-                        "delta_original": None,
-                        "delta_corrected": None
-                    })
+                elif anomaly_type == SPLIT_2:
+                    first_corr_ts = mea_list[d_e_index - 1] + ts_diff[i]
+                    corrected_ts[out], pattern_src[out] = first_corr_ts, i
+                    out += 1
+                    add_row(i, first_corr_ts, d_e_index - 1, row_offset, extra=1, d_orig=delta_original,
+                            d_corr=(first_corr_ts - prev_corr_ts) if prev_corr_ts is not None else None)
+
+                    second_corr_ts = mea_list[d_e_index]
+                    corrected_ts[out], pattern_src[out] = second_corr_ts, i + 1
+                    out += 1
+                    if i + 1 >= len(arduino_patterns):
+                        raise IndexError(f"split_2 at index {i} runs past the end of the LED log")
+                    add_row(i, second_corr_ts, d_e_index, row_offset)
 
                     d_e_index += 1
                     index_offset += 1
@@ -147,38 +224,23 @@ class AnomalyFixer:
                     prev_corr_ts = second_corr_ts
                     continue
 
-                elif anomaly_type == "split_3":
-                    first_corr_ts = mea_ts[d_e_index - 1] + (orig_ts - arduino_ts[i - 1])
-                    corrected_ts.append(first_corr_ts)
-                    corrected_patterns.append(pat)
-                    correction_records.append({
-                        **record,
-                        "corrected_timestamp": first_corr_ts,
-                        "extra_inserts": 2,
-                        "mea_indices_used": [d_e_index - 1]
-                    })
-
-                    second_corr_ts = mea_ts[d_e_index - 1] + \
-                                    (orig_ts - arduino_ts[i - 1]) + \
-                                    (arduino_ts[i + 1] - arduino_ts[i])
-                    corrected_ts.append(second_corr_ts)
-                    corrected_patterns.append(arduino_patterns[i + 1])
-                    correction_records.append({
-                        **record,
-                        "corrected_timestamp": second_corr_ts,
-                        "extra_inserts": 1,
-                        "mea_indices_used": [d_e_index - 1]
-                    })
-
-                    third_corr_ts = mea_ts[d_e_index]
-                    corrected_ts.append(third_corr_ts)
-                    corrected_patterns.append(arduino_patterns[i + 2])
-                    correction_records.append({
-                        **record,
-                        "corrected_timestamp": third_corr_ts,
-                        "extra_inserts": 0,
-                        "mea_indices_used": [d_e_index]
-                    })
+                elif anomaly_type == SPLIT_3:
+                    first_corr_ts = mea_list[d_e_index - 1] + ts_diff[i]
+                    corrected_ts[out], pattern_src[out] = first_corr_ts, i
+                    out += 1
+                    add_row(i, first_corr_ts, d_e_index - 1, row_offset, extra=2, d_orig=delta_original)
+
+                    second_corr_ts = first_corr_ts + ts_diff[i + 1]
+                    corrected_ts[out], pattern_src[out] = second_corr_ts, i + 1
+                    out += 1
+                    add_row(i, second_corr_ts, d_e_index - 1, row_offset, extra=1, d_orig=delta_original)
+
+                    third_corr_ts = mea_list[d_e_index]
+                    corrected_ts[out], pattern_src[out] = third_corr_ts, i + 2
+                    out += 1
+                    if i + 2 >= len(arduino_patterns):
+                        raise IndexError(f"split_3 at index {i} runs past the end of the LED log")
+                    add_row(i, third_corr_ts, d_e_index, row_offset, d_orig=delta_original)
 
                     d_e_index += 1
                     index_offset += 2
@@ -186,50 +248,34 @@ class AnomalyFixer:
                     prev_corr_ts = third_corr_ts
                     continue
 
-                elif anomaly_type == "pause" or anomaly_type == "unclassified":
-                    corr_ts = mea_ts[d_e_index]
-                    record["mea_indices_used"].append(d_e_index)
-                    d_e_index += 1
-
-                else:
-                    corr_ts = mea_ts[d_e_index]
-                    record["mea_indices_used"].append(d_e_index)
-                    d_e_index += 1
-
+                delta_corrected = delta_diff_change = None
                 if prev_corr_ts is not None:
-                    record["delta_corrected"] = corr_ts - prev_corr_ts
-                    if record["delta_original"] is not None:
-                        record["delta_diff_change"] = record["delta_corrected"] - record["delta_original"]
-
-                record["corrected_timestamp"] = corr_ts
+                    delta_corrected = corr_ts - prev_corr_ts
+                    if delta_original is not None:
+                        delta_diff_change = delta_corrected - delta_original
 
-                corrected_ts.append(corr_ts)
-                corrected_patterns.append(pat)
-                correction_records.append(record)
+                corrected_ts[out], pattern_src[out] = corr_ts, i
+                out += 1
+                add_row(i, corr_ts, mea_idx, row_offset, skip=skip,
+                        d_orig=delta_original, d_corr=delta_corrected, d_change=delta_diff_change)
 
                 prev_orig_ts = orig_ts
                 prev_corr_ts = corr_ts
         
         except Exception as e:
             success = False
-            logger.exception(f"Error during anomaly fixing at index {i}: {e}")
-            for j in range(i, len(arduino_ts)):
-                correction_records.append({
-                    "original_index": j,
-                    "original_timestamp": arduino_ts[j],
-                    "original_linetype": arduino_linetypes[j],
-                    "anomaly_type": "not_fixed_due_to_error",
-                    "handshake_phase": handshake_map.get(j, "none"),
-                    "overflow_fix": overflow_info[j][0],
-                    "overflow_offset": overflow_info[j][1],
-                    "mea_indices_used": [],
-                    "skip_count": None,
-                    "extra_inserts": None,
-                    "delta_original": None,
-                    "delta_corrected": None,
-                    "delta_diff_change": None,
-                    "corrected_timestamp": None
-                })
+            logger.exception("Error during anomaly fixing at index %s: %s", i, e)
+
+        # Timestamps from the failing index on are logged as not fixed, with empty correction fields
+        fail_src = np.arange(i, n_ts) if not success else np.empty(0, dtype=np.int64)
+        n_fail = len(fail_src)
+        src_all = np.concatenate((row_src[:n_rows], fail_src))
+
+        def with_missing_tail(values: np.ndarray) -> np.ndarray:
+            if not n_fail:
+                return values
+            return np.concatenate((values.astype(np.float64), np.full(n_fail, np.nan)))
+
         if not success:
             base_npz = os.path.splitext(output_npz_path)[0] + "_partial.npz"
             base_csv = os.path.splitext(correction_log_path)[0] + "_partial.csv"
@@ -237,21 +283,53 @@ class AnomalyFixer:
             base_npz = output_npz_path
             base_csv = correction_log_path
 
+        # A split at the very end of the log fails after its timestamp but before its pattern is stored
+        src = pattern_src[:out]
+        src = src[src < len(arduino_patterns)]
+        # Patterns are stored flat with row offsets, so the npz holds no pickled objects
+        if isinstance(arduino_patterns, np.ndarray):
+            patterns_flat = arduino_patterns[src].astype(np.uint8).ravel()
+            lengths = np.full(len(src), arduino_patterns.shape[1], dtype=np.int64)
+        else:
+            rows = [np.asarray(arduino_patterns[k], dtype=np.uint8) for k in src.tolist()]
+            patterns_flat = np.concatenate(rows) if rows else np.empty(0, dtype=np.uint8)
+            lengths = np.array([len(r) for r in rows], dtype=np.int64)
+        patterns_offsets = np.concatenate(([0], np.cumsum(lengths)))
+
         np.savez_compressed(base_npz,
-            timestamps=np.array(corrected_ts, dtype=np.int64),
-            patterns=np.array(corrected_patterns, dtype=object)
+            timestamps=corrected_ts[:out],
+            patterns=patterns_flat,
+            patterns_offsets=patterns_offsets
         )
         if success:
-            logger.info(f"Saved corrected data to {base_npz}")
+            logger.info("Saved corrected data to %s", base_npz)
         else:
-            logger.info(f"Saved PARTIAL corrected data to {base_npz}")
-
-        df = pd.DataFrame(correction_records)
-        df.to_csv(base_csv, index=False)
+            logger.info("Saved PARTIAL corrected data to %s", base_npz)
+
+        log_codes = np.concatenate((codes[row_src[:n_rows]], np.full(n_fail, _NOT_FIXED, dtype=np.int8)))
+        nan_tail = np.full(n_fail, np.nan)
+        df = pd.DataFrame({
+            "original_index": src_all,
+            "original_timestamp": arduino_ts[src_all],
+            "original_linetype": np.asarray(arduino_linetypes)[src_all],
+            "anomaly_type": pd.Categorical.from_codes(log_codes, categories=_ANOMALY_CATEGORIES),
+            "handshake_phase": pd.Categorical.from_codes(phase[src_all], categories=_PHASE_NAMES),
+            "overflow_fix": overflow_flags[src_all],
+            "overflow_offset": overflow_offsets[src_all],
+            "mea_indices_used": [f"[{k}]" for k in row_mea_idx[:n_rows].tolist()] + ["[]"] * n_fail,
+            "skip_count": with_missing_tail(row_skip[:n_rows]),
+            "extra_inserts": with_missing_tail(row_extra[:n_rows]),
+            "delta_original": np.concatenate((row_d_orig[:n_rows], nan_tail)),
+            "delta_corrected": np.concatenate((row_d_corr[:n_rows], nan_tail)),
+            "delta_diff_change": np.concatenate((row_d_change[:n_rows], nan_tail)),
+            "index_offset": with_missing_tail(row_index_offset[:n_rows]),
+            "corrected_timestamp": with_missing_tail(row_corr_ts[:n_rows]),
+        })
+        log_path = self.write_log(df, base_csv, log_format)
         if success:
-            logger.info(f"Saved correction log to {base_csv}")
+            logger.info("Saved correction log to %s", log_path)
         else:
-            logger.info(f"Saved PARTIAL correction log to {base_csv}")
+            logger.info("Saved PARTIAL correction log to %s", log_path)
 
         idx_off = (
             df.sort_values(["original_index"])
@@ -268,6 +346,6 @@ class AnomalyFixer:
             handshake_pairs=handshake_pairs or [],
             start_names=start_names or [],
             stop_names=stop_names or [],
-            anomalies=self.anomalies,
+            anomaly_codes=self.anomaly_codes,
             index_offset_series=idx_off
         )
\ No newline at end of file
@@ -1,7 +1,8 @@
 # syncing/handshake.py
 import numpy as np
+from collections import defaultdict
 from logging import getLogger
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from .exceptions import HandshakeError
 from .config import SyncConfig
 
@@ -22,13 +23,73 @@ class HandshakeDetector:
         self.start_sequences = cfg.handshake_start_sequences
         self.stop_sequences = cfg.handshake_stop_sequences 
 
+        # Sequence arrays are the same for every file in a run, so build them once;
+        # find() only reads these cached arrays and never rebuilds them
+        self._stop_arrays = self.compile_sequences(self.stop_sequences)
+        self._start_arrays = self.compile_sequences(self.start_sequences)
+        self._stop_buckets = self.bucket_by_length(self._stop_arrays)
+        self._start_buckets = self.bucket_by_length(self._start_arrays)
+
+    @staticmethod
+    def compile_sequences(sequences: dict) -> List[Tuple[str, np.ndarray]]:
+        """Returns (name, int32 diff array) pairs, longest sequence first."""
+        return [
+            (name, np.array(seq, dtype=np.int32))
+            for name, seq in sorted(sequences.items(), key=lambda x: -len(x[1]))
+        ]
+
+    @staticmethod
+    def bucket_by_length(compiled: List[Tuple[str, np.ndarray]]) -> List[Tuple[List[str], np.ndarray]]:
+        """
+        Groups compiled sequences into (names, (length, n_seqs) array) per length.
+        Stored column-major so each step of match_positions reads one contiguous row;
+        read-only because one detector is shared by every file of a run.
+        """
+        buckets = defaultdict(list)
+        for name, seq_arr in compiled:
+            buckets[len(seq_arr)].append((name, seq_arr))
+
+        grouped = []
+        for items in buckets.values():
+            seq_columns = np.ascontiguousarray(np.stack([seq_arr for _, seq_arr in items]).T)
+            seq_columns.setflags(write=False)
+            grouped.append(([name for name, _ in items], seq_columns))
+        return grouped
+
+    @staticmethod
+    def match_positions(diffs: np.ndarray, seq_columns: np.ndarray, tolerance: int) -> List[List[int]]:
+        """
+        For each sequence (column of seq_columns, shape (length, n_seqs)), the start
+        indices i where diffs[i:i + length] matches it within tolerance.
+        """
+        seq_len, n_seqs = seq_columns.shape
+        if len(diffs) < seq_len:
+            return [[] for _ in range(n_seqs)]
+        windows = np.lib.stride_tricks.sliding_window_view(diffs, seq_len)
+
+        # One window column at a time keeps the temporaries at (n_windows, n_seqs)
+        hits = np.ones((len(windows), n_seqs), dtype=bool)
+        for j in range(seq_len):
+            hits &= np.abs(windows[:, j, None] - seq_columns[j]) <= tolerance
+        return [np.flatnonzero(col).tolist() for col in hits.T]
+
+    def match_all(self, diffs: np.ndarray, buckets: List[Tuple[List[str], np.ndarray]],
+                  tolerance: int) -> Dict[str, List[int]]:
+        """Match positions per sequence name, one broadcast pass per sequence length."""
+        hits = {}
+        for names, seq_columns in buckets:
+            hits.update(zip(names, self.match_positions(diffs, seq_columns, tolerance)))
+        return hits
+
     def find(
         self,
         timestamps: np.ndarray,
-        tolerance: int = 1000
+        tolerance: int = 1000,
+        diffs: Optional[np.ndarray] = None
     ) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
         """
         Find handshake start/stop sequence index ranges in the timestamp array.
+        diffs: np.diff(timestamps), if the caller already has it
 
         Returns:
             List of tuples:
@@ -37,50 +98,49 @@ class HandshakeDetector:
         if len(timestamps) < 2:
             raise ValueError("Not enough timestamps for handshake detection")
 
-        diffs = np.diff(timestamps).astype(np.int32)
-        logger.debug(f"Computing diffs between {len(timestamps)} timestamps")
+        if diffs is None:
+            diffs = np.diff(timestamps)
+        diffs = diffs.astype(np.int32)
+        logger.debug("Computing diffs between %s timestamps", len(timestamps))
 
         start_indices = []
         stop_indices = []
         start_names = []
         stop_names = []
 
-        covered_stop = set()
-        covered_start = set()
+        covered_stop = np.zeros(len(diffs), dtype=bool)
+        covered_start = np.zeros(len(diffs), dtype=bool)
+
+        stop_hits = self.match_all(diffs, self._stop_buckets, tolerance)
+        start_hits = self.match_all(diffs, self._start_buckets, tolerance)
 
         # Detect STOP sequences first — longer ones get priority
-        for name, seq in sorted(self.stop_sequences.items(), key=lambda x: -len(x[1])):
-            seq_arr = np.array(seq, dtype=np.int32)
+        for name, seq_arr in self._stop_arrays:
             seq_len = len(seq_arr)
 
-            for i in range(len(diffs) - seq_len + 1):
-                if any(j in covered_stop for j in range(i, i + seq_len)):
+            for i in stop_hits[name]:
+                if covered_stop[i:i + seq_len].any():
                     continue
 
-                sub = diffs[i:i + seq_len]
-                if np.all(np.abs(sub - seq_arr) <= tolerance):
-                    stop_indices.append((i, i + seq_len))
-                    covered_stop.update(range(i, i + seq_len))
-                    stop_names.append(name)
-                    logger.info(f"Stop sequence {name} detected at {i}-{i + seq_len}")
+                stop_indices.append((i, i + seq_len))
+                covered_stop[i:i + seq_len] = True
+                stop_names.append(name)
+                logger.info("Stop sequence %s detected at %s-%s", name, i, i + seq_len)
 
         # Detect START sequences, avoiding overlap with STOp sequences
-        for name, seq in sorted(self.start_sequences.items(), key=lambda x: -len(x[1])):
-            seq_arr = np.array(seq, dtype=np.int32)
+        for name, seq_arr in self._start_arrays:
             seq_len = len(seq_arr)
 
-            for i in range(len(diffs) - seq_len + 1):
-                if i in covered_start:
+            for i in start_hits[name]:
+                if covered_start[i]:
                     continue
-                if any(j in covered_stop for j in range(i, i + seq_len)):
+                if covered_stop[i:i + seq_len].any():
                     continue
 
-                sub = diffs[i:i + seq_len]
-                if np.all(np.abs(sub - seq_arr) <= tolerance):
-                    start_indices.append((i, i + seq_len))
-                    covered_start.update(range(i, i + seq_len))
-                    start_names.append(name)
-                    logger.info(f"Start sequence {name} detected at {i}-{i + seq_len}")
+                start_indices.append((i, i + seq_len))
+                covered_start[i:i + seq_len] = True
+                start_names.append(name)
+                logger.info("Start sequence %s detected at %s-%s", name, i, i + seq_len)
 
         if not start_indices or not stop_indices:
             raise HandshakeError(
@@ -109,5 +169,5 @@ class HandshakeDetector:
                     f"Stop sequence before start sequence: start_end={start_range[1]}, stop_begin={stop_range[0]}"
                 )
 
-        logger.info(f"Detected {len(handshake_pairs)} handshake pairs")
+        logger.info("Detected %s handshake pairs", len(handshake_pairs))
         return handshake_pairs, start_names_sorted, stop_names_sorted
\ No newline at end of file
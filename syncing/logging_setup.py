@@ -1,24 +1,36 @@
 import logging
 import os
 from datetime import datetime
+from typing import Optional
 
-def setup_logging(log_dir: str, log_level: str = "INFO") -> logging.Logger:
+def setup_logging(log_dir: str,
+                  log_level: str = "INFO",
+                  log_file: Optional[str] = None,
+                  file_mode: str = "w") -> logging.Logger:
     """
     Central logging setup. Creates console + file handler.
     
     Args:
         log_dir    : Where to save log files.
         log_level  : Logging level ('DEBUG', 'INFO', etc.).
+        log_file   : Log file path; defaults to a timestamped file in log_dir.
+        file_mode  : 'w' to start the log file, 'a' to join it from a worker process.
 
     Returns:
         logging.Logger instance configured with file + stream handlers.
+        Calling it again (notebooks, forked workers) returns the configured logger unchanged.
     """
+    logger = logging.getLogger("syncing")
+    if logger.handlers:
+        return logger
+    logger.propagate = False  # the root logger must not emit every record a second time
+
     os.makedirs(log_dir, exist_ok=True)
 
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    log_file = os.path.join(log_dir, f"sync_log_{timestamp}.log")
+    if log_file is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        log_file = os.path.join(log_dir, f"sync_log_{timestamp}.log")
 
-    logger = logging.getLogger("syncing")
     logger.setLevel(getattr(logging, log_level.upper()))
 
     # Formatter
@@ -33,7 +45,7 @@ def setup_logging(log_dir: str, log_level: str = "INFO") -> logging.Logger:
     ch.setFormatter(fmt)
 
     # File handler
-    fh = logging.FileHandler(log_file, mode='w')
+    fh = logging.FileHandler(log_file, mode=file_mode)
     fh.setLevel(getattr(logging, log_level.upper()))
     fh.setFormatter(fmt)
 
@@ -41,7 +53,7 @@ def setup_logging(log_dir: str, log_level: str = "INFO") -> logging.Logger:
     logger.addHandler(fh)
 
     logger.info("Logging initialised")
-    logger.info(f"Log file: {log_file}")
-    logger.info(f"Log level: {log_level}")
+    logger.info("Log file: %s", log_file)
+    logger.info("Log level: %s", log_level)
 
     return logger
\ No newline at end of file
@@ -1,33 +1,38 @@
 import numpy as np
 from typing import List, Tuple
 
-def trim_to_handshake_windows(timestamps: np.ndarray,
-                              handshake_pairs: List[Tuple[Tuple[int, int], Tuple[int, int]]]
-                              ) -> np.ndarray:
+def trim_and_map(timestamps: np.ndarray,
+                 handshake_pairs: List[Tuple[Tuple[int, int], Tuple[int, int]]]
+                 ) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Remove handshake sequences from timestamps and return only the stimulus-phase timestamps.
+    Keep only the stimulus-phase timestamps between each start and stop handshake.
 
     Args:
         timestamps: np.ndarray of timestamps (full session)
         handshake_pairs: list of ((start_begin, start_end), (stop_begin, stop_end))
                          These are INDEX ranges from HandshakeDetector.find()
     Returns:
-        np.ndarray of timestamps within stimulus phases only.
+        (trimmed timestamps, index of each trimmed timestamp in the input array)
     """
-    trimmed = []
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    windows = []
     for (start_range, stop_range) in handshake_pairs:
         # Handshake indices are diff indices, convert to timestamp indices:
         start_idx = start_range[1]   # timestamp after handshake start ends
         stop_idx = stop_range[0]     # timestamp before handshake stop begins
-        trimmed.extend(timestamps[start_idx:stop_idx])
-    return np.array(trimmed, dtype=np.int64)
+        windows.append(range(len(timestamps))[start_idx:stop_idx])  # clipped like a slice
+    if not windows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    trimmed = np.concatenate([timestamps[w.start:w.stop] for w in windows])
+    index_map = np.concatenate([np.arange(w.start, w.stop, dtype=np.int64) for w in windows])
+    return trimmed, index_map
+
+def trim_to_handshake_windows(timestamps: np.ndarray,
+                              handshake_pairs: List[Tuple[Tuple[int, int], Tuple[int, int]]]
+                              ) -> np.ndarray:
+    """Stimulus-phase timestamps only; see trim_and_map."""
+    return trim_and_map(timestamps, handshake_pairs)[0]
 
 def trim_with_index_mapping(timestamps, handshake_pairs):
-    trimmed = []
-    index_map = []
-    for (start_range, stop_range) in handshake_pairs:
-        start_idx = start_range[1]  # first after start handshake ends
-        stop_idx = stop_range[0]    # before stop handshake
-        trimmed.extend(timestamps[start_idx:stop_idx])
-        index_map.extend(range(start_idx, stop_idx))
-    return np.array(trimmed, dtype=np.int64), index_map
\ No newline at end of file
+    return trim_and_map(timestamps, handshake_pairs)
@@ -1,7 +1,7 @@
 import numpy as np
 from typing import List, Tuple
 
-def find_yline_after_start_handshake(arduino_linetypes: List[int], 
+def find_yline_after_start_handshake(arduino_linetypes: np.ndarray, 
                                      handshake_pairs: List[Tuple[Tuple[int, int], Tuple[int, int]]],
                                      byte_y: int):
     